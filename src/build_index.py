@@ -20,14 +20,67 @@ import argparse
 import json
 import os
 import logging
+import queue
+import threading
 
-from chroma_client import get_chroma_client, upsert_to_chroma
-from utils import load_embedding_model, embed_texts, sentence_split, make_chunks
+from chroma_client import get_chroma_client, get_or_create_collection
+from utils import load_embedding_model, embed_texts_stream, sentence_split, iter_chunks
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
 
+def embed_and_upsert(model, collection, chunk_iter, source: str, embed_batch_size: int = 256) -> int:
+    """
+    Overlap embedding with Chroma insertion: the main thread encodes slice N+1
+    while a writer thread adds slice N (collection.add is SQLite-bound and
+    releases the GIL, so the two stages run concurrently). Consumes chunks from
+    an iterator, so insertion starts before splitting/chunking has finished.
+    Returns the number of chunks indexed.
+    """
+    work = queue.Queue(maxsize=2)
+    errors = []
+
+    def writer():
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            if errors:
+                # keep draining so a blocked producer put() can't deadlock
+                continue
+            try:
+                collection.add(**item)
+            except Exception as e:
+                logger.exception("Chromadb add failed: %s", e)
+                errors.append(e)
+
+    t = threading.Thread(target=writer, daemon=True)
+    t.start()
+    n_chunks = 0
+    for chunks_batch, embs in embed_texts_stream(model, chunk_iter, batch_size=embed_batch_size):
+        if errors:
+            break
+        ids = []
+        metadatas = []
+        for chunk_idx in range(n_chunks, n_chunks + len(chunks_batch)):
+            cid = f"chunk_{chunk_idx:04d}"
+            ids.append(cid)
+            metadatas.append({"chunk_id": cid, "source": source, "chunk_index": chunk_idx})
+        n_chunks += len(chunks_batch)
+        work.put({
+            "ids": ids,
+            "documents": chunks_batch,
+            "metadatas": metadatas,
+            "embeddings": embs
+        })
+    work.put(None)
+    t.join()
+    if errors:
+        raise errors[0]
+    return n_chunks
+
+
 def build_index(input_path: str, persist_dir: str, collection_name: str, model_name: str, approx_chars: int, overlap_chars: int):
     if not os.path.isfile(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
@@ -37,30 +90,26 @@ def build_index(input_path: str, persist_dir: str, collection_name: str, model_n
 
     sentences = sentence_split(text)
     logger.info("Split input into %d sentences/paragraphs", len(sentences))
-    chunks = make_chunks(sentences, approx_chars=approx_chars, overlap_chars=overlap_chars)
-    logger.info("Created %d chunks (approx_chars=%d overlap=%d)", len(chunks), approx_chars, overlap_chars)
-
-    if len(chunks) < 20:
-        logger.warning("Created fewer than 20 chunks (%d). Consider reducing approx_chars or overlap_chars.", len(chunks))
+    chunk_iter = iter_chunks(sentences, approx_chars=approx_chars, overlap_chars=overlap_chars)
 
     # embed
     model = load_embedding_model(model_name)
-    embeddings = embed_texts(model, chunks)
 
-    # prepare ids & metadata
-    ids = [f"chunk_{i:04d}" for i in range(len(chunks))]
-    metadatas = [{"chunk_id": ids[i], "source": os.path.basename(input_path), "chunk_index": i} for i in range(len(chunks))]
-
-    # chroma
+    # chroma: chunk, embed and insert as one streaming pipeline
     client = get_chroma_client(persist_dir)
-    collection = upsert_to_chroma(client, collection_name, ids, chunks, metadatas, embeddings)
+    collection = get_or_create_collection(client, collection_name)
+    n_chunks = embed_and_upsert(model, collection, chunk_iter, source=os.path.basename(input_path))
+    logger.info("Created %d chunks (approx_chars=%d overlap=%d)", n_chunks, approx_chars, overlap_chars)
+
+    if n_chunks < 20:
+        logger.warning("Created fewer than 20 chunks (%d). Consider reducing approx_chars or overlap_chars.", n_chunks)
 
     # save manifest
     manifest = {
         "input_path": os.path.abspath(input_path),
         "collection_name": collection_name,
         "persist_dir": os.path.abspath(persist_dir),
-        "n_chunks": len(chunks)
+        "n_chunks": n_chunks
     }
     with open(os.path.join(persist_dir, f"{collection_name}_manifest.json"), "w", encoding="utf-8") as mf:
         json.dump(manifest, mf, indent=2)
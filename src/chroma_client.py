@@ -1,35 +1,67 @@
+import functools
+
 import chromadb
+import numpy as np
 from typing import List, Dict
+from tqdm import tqdm
+
+# cosine space on pre-normalized vectors lets HNSW use inner product and skip
+# per-query norm math; construction_ef/M are the recall/build-time knobs
+COSINE_HNSW_METADATA = {"hnsw:space": "cosine", "hnsw:construction_ef": 100, "hnsw:M": 16}
 
+
+@functools.lru_cache(maxsize=1)
 def get_chroma_client(persist_dir: str):
+    # cached so repeated queries reuse the open HNSW index
     client = chromadb.PersistentClient(persist_dir)
     return client
 
-def upsert_to_chroma(client, collection_name: str, ids: List[str], docs: List[str], metadatas: List[Dict], embeddings: List[List[float]]):
+
+def get_or_create_collection(client, collection_name: str):
+    """Create (or open) a collection configured for cosine search."""
+    return client.get_or_create_collection(name=collection_name, metadata=COSINE_HNSW_METADATA)
+
+
+_warned_legacy_collections = set()
+
+def _warn_if_legacy_space(collection):
+    """Queries are embedded unit-length; against a pre-cosine (L2, unnormalized)
+    store the distances are skewed, so tell the user to rebuild."""
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    if space != "cosine" and collection.name not in _warned_legacy_collections:
+        _warned_legacy_collections.add(collection.name)
+        print(f"Warning: collection '{collection.name}' uses {space} space with embeddings "
+              "indexed before query normalization was enabled; rankings may differ. "
+              "Rebuild the index with build_index.py.")
+
+def upsert_to_chroma(client, collection_name: str, ids: List[str], docs: List[str], metadatas: List[Dict], embeddings: np.ndarray, batch_size: int = 200):
+    """Insert documents in mini-batches so each collection.add stays within
+    Chroma's recommended batch range instead of one huge transaction per row."""
     # create collection if not exists
-    collection = client.get_or_create_collection(name=collection_name)
+    collection = get_or_create_collection(client, collection_name)
     print("Upserting %d documents into Chromadb collection '%s'", len(docs), collection_name)
-    collection.add(
-        ids=ids,
-        documents=docs,
-        metadatas=metadatas,
-        embeddings=embeddings
-    )
+    try:
+        for i in tqdm(range(0, len(ids), batch_size), desc="Upserting batches"):
+            collection.add(
+                ids=ids[i:i+batch_size],
+                documents=docs[i:i+batch_size],
+                metadatas=metadatas[i:i+batch_size],
+                embeddings=embeddings[i:i+batch_size]
+            )
+    except Exception as e:
+        print("Chromadb batch add failed: %s" % e)
+        raise
     return collection
 
 
-def search_chroma(client, collection_name: str, query_embedding: List[float], k: int = 5):
-    collection = client.get_collection(name=collection_name)
-    res = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=k,
-        include=["documents", "metadatas", "distances"]
-    )
-    # result format: dictionaries containing lists for each query (we only have 1 query)
-    doc_ids = res.get("ids", [[]])[0]
-    docs = res.get("documents", [[]])[0]
-    metadatas = res.get("metadatas", [[]])[0]
-    distances = res.get("distances", [[]])[0]
+def _format_query_results(res, query_index: int):
+    """Flatten Chroma's parallel result lists for one query into result dicts."""
+    doc_ids = res.get("ids", [[]])[query_index]
+    docs = res.get("documents", [[]])[query_index]
+    metadatas = res.get("metadatas", [[]])[query_index]
+    # distances are only present when the caller asked for them
+    all_distances = res.get("distances") or []
+    distances = all_distances[query_index] if query_index < len(all_distances) else []
     results = []
     for i, doc in enumerate(docs):
         results.append({
@@ -39,3 +71,35 @@ def search_chroma(client, collection_name: str, query_embedding: List[float], k:
             "relevance_score": float(distances[i]) if i < len(distances) else None
         })
     return results
+
+
+def search_chroma(client, collection_name: str, query_embedding: np.ndarray, k: int = 5, include_distances: bool = True):
+    collection = client.get_collection(name=collection_name)
+    _warn_if_legacy_space(collection)
+    include = ["documents", "metadatas"]
+    if include_distances:
+        include.append("distances")
+    res = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=k,
+        include=include
+    )
+    # result format: dictionaries containing lists for each query (we only have 1 query)
+    return _format_query_results(res, 0)
+
+
+def search_chroma_batch(client, collection_name: str, query_embeddings: np.ndarray, k: int = 5, include_distances: bool = False):
+    """Run many k-NN queries in one Chroma call; returns one result list per query.
+    Distances are skipped by default: evaluator scoring never reads relevance_score,
+    and every included field is serialized per hit, which adds up at large k*N."""
+    collection = client.get_collection(name=collection_name)
+    _warn_if_legacy_space(collection)
+    include = ["documents", "metadatas"]
+    if include_distances:
+        include.append("distances")
+    res = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=k,
+        include=include
+    )
+    return [_format_query_results(res, q) for q in range(len(res.get("ids", [])))]
@@ -32,41 +32,51 @@ STOPWORDS = {
     "at","which","have","has","was","were","but","not","their","they","we","our","you","your","will","can","may","such"
 }
 
+# compiled once at import; tokenize is called per sentence and per chunk
+_WORD_RE = re.compile(r"\b\w+\b")
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+_CITE_RE = re.compile(r"chunk[_\-]?\d{3,6}")
+
 def tokenize(text: str):
     """Simple tokenization."""
-    words = re.findall(r"\b\w+\b", text.lower())
-    return [w for w in words if len(w) >= 2]
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) >= 2]
+
+def content_tokens(text: str):
+    """Tokens with stopwords and short words filtered out (set-based lookup)."""
+    return [w for w in tokenize(text) if len(w) > 3 and w not in STOPWORDS]
 
 def sentence_split(text: str):
     """Naive sentence split."""
-    parts = re.split(r'(?<=[.!?])\s+', text.strip())
+    parts = _SENT_RE.split(text.strip())
     return [p.strip() for p in parts if p.strip()]
 
 def extract_top_keywords_from_chunks(chunks_related: List[Dict[str,Any]], top_k: int = 20):
     """Extract top keywords from retrieved chunks."""
-    all_words = []
+    counts = Counter()
     for c in chunks_related:
-        all_words.extend(tokenize(c.get("document", "")))
-    filtered = [w for w in all_words if w not in STOPWORDS and len(w) > 3]
-    counts = Counter(filtered)
+        counts.update(content_tokens(c.get("document", "")))
     return [w for w,_ in counts.most_common(top_k)]
 
-def sentence_supported_by_chunks(sentence: str, chunks_related: List[Dict[str,Any]], overlap_threshold: int = 3):
-    """Check if a sentence is supported by chunks based on token overlap."""
-    sent_tokens = [w for w in tokenize(sentence) if w not in STOPWORDS and len(w) > 3]
-    if not sent_tokens:
-        return False, 0
-
+def chunk_word_set(chunks_related: List[Dict[str,Any]]):
+    """Content-token vocabulary of the retrieved chunks, built once per answer."""
     chunk_words = set()
     for c in chunks_related:
-        chunk_words.update([w for w in tokenize(c.get("document","")) if w not in STOPWORDS and len(w) > 3])
+        chunk_words.update(content_tokens(c.get("document","")))
+    return chunk_words
+
+def sentence_supported_by_chunks(sentence: str, chunk_words: set, overlap_threshold: int = 3):
+    """Check if a sentence is supported by chunks based on token overlap.
+    chunk_words is the precomputed vocabulary from chunk_word_set."""
+    sent_tokens = content_tokens(sentence)
+    if not sent_tokens:
+        return False, 0
 
-    match_count = sum(1 for w in set(sent_tokens) if w in chunk_words)
+    match_count = len(set(sent_tokens) & chunk_words)
     return (match_count >= overlap_threshold, match_count)
 
 def extract_cited_chunk_ids(answer_text: str):
     """Find chunk references such as [chunk_0001] or chunk_0001."""
-    ids = set(re.findall(r"chunk[_\-]?\d{3,6}", answer_text.lower()))
+    ids = set(_CITE_RE.findall(answer_text.lower()))
     return list(ids)
 
 def evaluate_response(user_question: str, system_answer: str, chunks_related: List[Dict[str,Any]]):
@@ -85,8 +95,9 @@ def evaluate_response(user_question: str, system_answer: str, chunks_related: Li
     else:
         support_matches = []
         match_counts = []
+        chunk_words = chunk_word_set(chunks_related)
         for s in sentences:
-            supported, match_count = sentence_supported_by_chunks(s, chunks_related, overlap_threshold=2)
+            supported, match_count = sentence_supported_by_chunks(s, chunk_words, overlap_threshold=2)
             support_matches.append(supported)
             match_counts.append(match_count)
 
@@ -117,7 +128,7 @@ def evaluate_response(user_question: str, system_answer: str, chunks_related: Li
         covered_kw_ratio = 0.0
     else:
         ans_tokens = set(tokenize(system_answer))
-        covered = sum(1 for kw in top_keywords if kw in ans_tokens)
+        covered = len(set(top_keywords) & ans_tokens)
         covered_kw_ratio = covered / len(top_keywords)
         completeness_score = round(covered_kw_ratio * 3, 2)
 
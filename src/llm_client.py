@@ -1,4 +1,6 @@
-from openai import OpenAI
+import asyncio
+
+from openai import OpenAI, AsyncOpenAI
 
 
 class OpenAIClient:
@@ -8,7 +10,11 @@ class OpenAIClient:
         self.api_key = api_key
         try:
             self.client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",    
+                base_url="https://openrouter.ai/api/v1",
+                api_key=self.api_key
+            )
+            self.aclient = AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
                 api_key=self.api_key
             )
         except Exception as e:
@@ -28,7 +34,33 @@ class OpenAIClient:
         output_tokens = response.usage.output_tokens
         model_response = response.output[0].content[0].text
         return model_response, input_tokens, output_tokens
-    
+
+    async def acall_openai(self, user_question: str, context: str, system_msg: str = "You are an intelligent helpful assistant", max_retries: int = 3):
+        '''Async variant of call_openai with exponential backoff, so evaluation
+        sweeps can issue many requests concurrently and survive transient 429s.'''
+        delay = 1.0
+        for attempt in range(max_retries):
+            try:
+                response = await self.aclient.responses.create(
+                    model='gpt-4o-mini',
+                    input=[
+                        {"role": "system", "content": system_msg},
+                        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {user_question}\n\nAnswer concisely, accurately, and cite chunk ids that support the answer."}
+                    ],
+                    temperature=0.0,
+                    max_output_tokens=200
+                )
+                break
+            except Exception:
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+        input_tokens = response.usage.input_tokens
+        output_tokens = response.usage.output_tokens
+        model_response = response.output[0].content[0].text
+        return model_response, input_tokens, output_tokens
+
     # The OpenAI GPT-4o mini costs $0.15 per 1 million input tokens and $0.60 per 1 million output tokens
     def calculate_request_cost(self, num_input_tokens: int, num_output_tokens: int) -> float:
         '''Calculate cost based on token count and rates.
@@ -15,6 +15,7 @@ Usage:
 """
 
 import argparse
+import asyncio
 import os
 import json
 import time
@@ -45,19 +46,26 @@ logger.addHandler(file_handler)
 logger.addHandler(logging.StreamHandler())
 
 
-def prompt_for_answer(question: str, retrieved_chunks: List[Dict], system_instructions: str = None) -> str:
-    """
-    Construct a prompt that gives the model the retrieved chunks and asks for a concise, accurate answer.
-    """
-    system_instructions = system_instructions or ("You are an HR SaaS product assistant. Use only the provided chunks to answer the user. "
-                                                "When appropriate, cite the chunk_id(s) you used in brackets like [chunk_0001]. If the answer is not found, say you don't know and suggest next steps.")
-    # build context
+DEFAULT_SYSTEM_INSTRUCTIONS = ("You are an HR SaaS product assistant. Use only the provided chunks to answer the user. "
+                               "When appropriate, cite the chunk_id(s) you used in brackets like [chunk_0001]. If the answer is not found, say you don't know and suggest next steps.")
+
+
+def build_context(retrieved_chunks: List[Dict]) -> str:
+    """Format retrieved chunks into the context block given to the model."""
     context_pieces = []
     for i, c in enumerate(retrieved_chunks):
         meta = c.get("metadata", {})
         chunk_id = meta.get("chunk_id", f"chunk_{i}")
         context_pieces.append(f"--- {chunk_id} ---\n{c.get('document')}\n")
-    context_text = "\n".join(context_pieces)
+    return "\n".join(context_pieces)
+
+
+def prompt_for_answer(question: str, retrieved_chunks: List[Dict], system_instructions: str = None) -> str:
+    """
+    Construct a prompt that gives the model the retrieved chunks and asks for a concise, accurate answer.
+    """
+    system_instructions = system_instructions or DEFAULT_SYSTEM_INSTRUCTIONS
+    context_text = build_context(retrieved_chunks)
 
     # call OpenAI endpoint
     try:
@@ -71,48 +79,81 @@ def prompt_for_answer(question: str, retrieved_chunks: List[Dict], system_instru
     return response, input_tokens, output_tokens, cost_for_request
 
 
-#-------- CLI / main --------------
+def answer_one(question: str, persist_dir: str = "./chroma_store", collection_name: str = "hr_faq",
+               model_name: str = "all-mpnet-base-v2", k: int = 5) -> Dict:
+    """
+    Answer a single question end-to-end, reusing the cached embedding model and
+    Chroma client so callers (FastAPI, streamlit, eval loops) pay the load cost once.
+    Returns a dict with user_question, system_answer and chunks_related.
+    """
+    start = time.perf_counter()
+    model = load_embedding_model(model_name)
+    emb = embed_query(model, question)
 
-def parse_args():
-    parser = argparse.ArgumentParser(description="Query the HR FAQ vector store and get an LLM answer.")
-    parser.add_argument("--question", "-q", type=str, help="User question. If not provided, will prompt interactively.")
-    parser.add_argument("--persist_dir", "-p", default="./chroma_store", help="Chromadb persist directory")
-    parser.add_argument("--collection_name", "-c", default="hr_faq", help="Chromadb collection name")
-    parser.add_argument("--model", default="all-mpnet-base-v2", help="Embedding model (sentence-transformers)")
-    parser.add_argument("--k", type=int, default=5, help="Number of nearest neighbors to retrieve")
-    return parser.parse_args()
+    # connect chroma & search
+    client = get_chroma_client(persist_dir)
+    try:
+        retrieved = search_chroma(client, collection_name, emb, k=k)
+    except Exception as e:
+        logger.exception("Chromadb query failed: %s", e)
+        raise
 
-def main():
-    args = parse_args()
-    question = args.question
-    if not question:
-        question = input("Enter your question: ").strip()
-    if not question:
-        print("No question provided. Exiting.")
-        return
+    # generate answer with LLM
+    try:
+        answer, num_input_tokens, num_output_tokens, cost = prompt_for_answer(question, retrieved)
+    except Exception as e:
+        logger.exception("Answer generation failed: %s", e)
+        raise
 
-    if not os.path.isdir(args.persist_dir):
-        raise FileNotFoundError(f"Persist directory not found: {args.persist_dir}. Have you run build_index.py?")
+    latency_ms = (time.perf_counter() - start) * 1000
+    metrics = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "latency_ms": "{:.6f}".format(latency_ms),
+            "tokens_prompt": num_input_tokens,
+            "tokens_completion": num_output_tokens,
+            "tokens_total": num_input_tokens + num_output_tokens,
+            "estimated_cost_usd": "{:.6f}".format(cost)
+        }
+
+    logger.info(f"Request metrics: {metrics}")
+    save_metrics_to_csv(metrics)
 
+    return {
+        "user_question": question,
+        "system_answer": answer,
+        "chunks_related": retrieved
+    }
+
+
+async def aanswer(question: str, persist_dir: str = "./chroma_store", collection_name: str = "hr_faq",
+                  model_name: str = "all-mpnet-base-v2", k: int = 5) -> Dict:
+    """
+    Async variant of answer_one: awaits the LLM round-trip (with retry/backoff),
+    so evaluation sweeps can score many questions concurrently via asyncio.gather.
+    """
     start = time.perf_counter()
-    # load model
-    model = load_embedding_model(args.model)
+    model = load_embedding_model(model_name)
     emb = embed_query(model, question)
 
     # connect chroma & search
-    client = get_chroma_client(args.persist_dir)
+    client = get_chroma_client(persist_dir)
     try:
-        retrieved = search_chroma(client, args.collection_name, emb, k=args.k)
+        retrieved = search_chroma(client, collection_name, emb, k=k)
     except Exception as e:
         logger.exception("Chromadb query failed: %s", e)
         raise
 
     # generate answer with LLM
     try:
-        answer, num_input_tokens, num_output_tokens, cost = prompt_for_answer(question, retrieved)
+        answer, num_input_tokens, num_output_tokens = await openai_client.acall_openai(
+            user_question=question,
+            context=build_context(retrieved),
+            system_msg=DEFAULT_SYSTEM_INSTRUCTIONS
+        )
     except Exception as e:
         logger.exception("Answer generation failed: %s", e)
         raise
+    cost = openai_client.calculate_request_cost(num_input_tokens, num_output_tokens)
 
     latency_ms = (time.perf_counter() - start) * 1000
     metrics = {
@@ -123,21 +164,53 @@ def main():
             "tokens_total": num_input_tokens + num_output_tokens,
             "estimated_cost_usd": "{:.6f}".format(cost)
         }
-        
+
     logger.info(f"Request metrics: {metrics}")
     save_metrics_to_csv(metrics)
 
-    output = {
+    return {
         "user_question": question,
         "system_answer": answer,
         "chunks_related": retrieved
     }
 
+
+#-------- CLI / main --------------
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the HR FAQ vector store and get an LLM answer.")
+    parser.add_argument("--question", "-q", type=str, help="User question. If not provided, will prompt interactively.")
+    parser.add_argument("--persist_dir", "-p", default="./chroma_store", help="Chromadb persist directory")
+    parser.add_argument("--collection_name", "-c", default="hr_faq", help="Chromadb collection name")
+    parser.add_argument("--model", default="all-mpnet-base-v2", help="Embedding model (sentence-transformers)")
+    parser.add_argument("--k", type=int, default=5, help="Number of nearest neighbors to retrieve")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    question = args.question
+    if not question:
+        question = input("Enter your question: ").strip()
+    if not question:
+        print("No question provided. Exiting.")
+        return
+
+    if not os.path.isdir(args.persist_dir):
+        raise FileNotFoundError(f"Persist directory not found: {args.persist_dir}. Have you run build_index.py?")
+
+    output = asyncio.run(aanswer(
+        question,
+        persist_dir=args.persist_dir,
+        collection_name=args.collection_name,
+        model_name=args.model,
+        k=args.k
+    ))
+
     print("----- Final Output -----\n")
     print(json.dumps(output, indent=2, ensure_ascii=False))
 
     # response evaluation
-    evaluation = evaluate_response(question, answer, retrieved)
+    evaluation = evaluate_response(question, output["system_answer"], output["chunks_related"])
     print("\n----- Evaluation -----\n")
     print(json.dumps(evaluation, indent=2, ensure_ascii=False))
 